@@ -9,15 +9,25 @@ This script:
 4. Combines results when all workers are done
 """
 
-import json
+import orjson
 import time
 import os
 import subprocess
 import logging
 import sys
+import re
+import queue
 import threading
+import heapq
+import ijson
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # inotify is Linux-only, fall back to polling elsewhere
+    INotify = None
 
 # Configure logging
 logging.basicConfig(
@@ -36,6 +46,7 @@ INPUT_FILE = os.environ.get('INPUT_FILE', '/data/vulnerability_dataset.json')
 OUTPUT_FILE = os.environ.get('OUTPUT_FILE', '/results/vulnerability_dataset.enhanced.json')
 FRAGMENT_DIR = "/data/fragments"
 RESULT_DIR = "/results/fragments"
+MANIFEST_FILE = f"{FRAGMENT_DIR}/manifest.json"
 
 # Create necessary directories
 os.makedirs(FRAGMENT_DIR, exist_ok=True)
@@ -43,83 +54,237 @@ os.makedirs(RESULT_DIR, exist_ok=True)
 
 # Store progress info for each worker
 worker_status = {}
-worker_logs = defaultdict(list)
+worker_logs = defaultdict(lambda: deque(maxlen=4))  # Only the latest lines are displayed
 status_lock = threading.Lock()
+# Set by whichever observer first sees a worker finish, and once all of them have
+worker_done = {}
+all_done = threading.Event()
+# Overall entry counts, kept up to date as worker progress changes
+GLOBAL_TOTALS = {"total": 0, "processed": 0}
+# Open descriptors and partial-line buffers for the worker logs being followed
+log_fds = {}
+log_buffers = defaultdict(bytearray)
+# Worker ids whose status changed, consumed by display_status
+status_updates = queue.Queue()
 
-def load_and_split_data():
-    """Load the JSON dataset and split it into fragments."""
-    logger.info(f"Loading data from {INPUT_FILE}")
+LOG_FILE_PATTERN = re.compile(r"worker_(\d+)\.log$")
+RESULT_FILE_PATTERN = re.compile(r"result_(\d+)\.json$")
+
+# Worker log markers, matched in a single pass per line
+LOG_LINE_PATTERN = re.compile(
+    r"(?P<start>Starting Ollama)"
+    r"|(?P<pull>Pulling model)"
+    r"|(?P<ready>Ollama service is running)"
+    r"|(?P<proc>processing fragment)"
+    r"|(?P<prog>Processed (?P<current>\d+)/(?P<total>\d+) entries)"
+    r"|(?P<done>Processing completed)"
+)
+LOG_STAGES = {
+    "start": "Starting Ollama",
+    "pull": "Pulling model",
+    "ready": "Ollama ready",
+    "proc": "Processing",
+}
+
+# ijson events that begin a new value inside an array
+ENTRY_START_EVENTS = ("start_map", "start_array", "string", "number", "boolean", "null")
+# Entry fields whose length approximates the work an entry needs from the LLM
+WEIGHT_FIELDS = ("input", "output")
+ENTRIES_PLACEHOLDER = "__enhancer_entries__"
+FRAGMENT_WRITE_CHUNK = 1 << 20  # Bytes buffered per fragment before handing them to a writer thread
+RESULT_POLL_INTERVAL = 5  # Seconds between result file checks while waiting, in case a watch event was missed
+
+def first_char(f):
+    """Return the first non-whitespace byte of a binary file and rewind it."""
+    while True:
+        char = f.read(1)
+        if not char or not char.isspace():
+            f.seek(0)
+            return char
+
+def scan_input():
+    """Detect the structure of the input and weigh its entries without loading them.
     
-    try:
-        with open(INPUT_FILE, 'r') as f:
-            data = json.load(f)
+    Returns (data_structure, list_field_name, wrapper, weights). For dict layouts the
+    wrapper holds every top-level field, with the entries list left empty. weights has
+    one entry per dataset entry: the length of its prompt fields, a proxy for LLM time.
+    """
+    with open(INPUT_FILE, 'rb') as f:
+        if first_char(f) == b'[':
+            weights = []
+            weight_prefixes = {f"item.{field}" for field in WEIGHT_FIELDS}
+            for prefix, event, value in ijson.parse(f):
+                if prefix == "item" and event in ENTRY_START_EVENTS:
+                    weights.append(0)
+                elif event == "string" and prefix in weight_prefixes:
+                    weights[-1] += len(value)
+            return "list", None, None, weights
+        
+        # Walk the top-level object, building every field except lists, whose items are only weighed
+        wrapper = {}
+        list_weights = {}
+        key = None
+        builder = None
+        depth = 0
+        for prefix, event, value in ijson.parse(f, use_float=True):
+            if depth == 1:
+                if event == "map_key":
+                    key = value
+                elif event == "start_array":
+                    wrapper[key] = []
+                    list_weights[key] = []
+                    weight_prefixes = {f"{key}.item.{field}" for field in WEIGHT_FIELDS}
+                elif event == "start_map":
+                    builder = ijson.ObjectBuilder()
+                    builder.event(event, value)
+                elif event != "end_map":
+                    wrapper[key] = value
+            elif depth >= 2:
+                if builder is not None:
+                    builder.event(event, value)
+                elif depth == 2 and event in ENTRY_START_EVENTS:
+                    list_weights[key].append(0)
+                elif event == "string" and prefix in weight_prefixes:
+                    list_weights[key][-1] += len(value)
+            
+            if event in ("start_map", "start_array"):
+                depth += 1
+            elif event in ("end_map", "end_array"):
+                depth -= 1
+                if depth == 1 and builder is not None:
+                    wrapper[key] = builder.value
+                    builder = None
         
-        # Determine data structure
-        if isinstance(data, list):
-            entries = data
-            data_structure = "list"
-        elif isinstance(data, dict) and "data" in data:
-            entries = data["data"]
+        if "data" in list_weights:
             data_structure = "dict_with_data"
+            list_field_name = "data"
+        elif list_weights:
+            data_structure = "dict_with_list"
+            list_field_name = next(iter(list_weights))
         else:
-            # Try to find any list field in the JSON
-            list_fields = [k for k, v in data.items() if isinstance(v, list)]
-            if list_fields:
-                entries = data[list_fields[0]]
-                data_structure = "dict_with_list"
-                list_field_name = list_fields[0]
-            else:
-                entries = [data]  # Treat the whole JSON as a single entry
-                data_structure = "single_object"
+            # Treat the whole JSON as a single entry
+            return "single_object", None, wrapper, [0]
         
-        logger.info(f"Loaded {len(entries)} entries, detected structure: {data_structure}")
+        # Any other top-level lists are small enough to keep in the wrapper as they are
+        for other_field in list_weights:
+            if other_field != list_field_name:
+                f.seek(0)
+                wrapper[other_field] = next(ijson.items(f, other_field, use_float=True))
         
-        # Calculate fragment sizes
-        total_entries = len(entries)
-        base_size = total_entries // NUM_WORKERS
-        remainder = total_entries % NUM_WORKERS
+        return data_structure, list_field_name, wrapper, list_weights[list_field_name]
+
+def write_fragment_chunk(fd, data):
+    """Write a chunk of a fragment file, retrying until the kernel has taken all of it."""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def balance_fragments(weights):
+    """Split entries into NUM_WORKERS fragments, longest first into the least loaded fragment.
+    
+    Returns the fragment index of every entry, plus the size and total weight of each fragment.
+    """
+    assignment = [0] * len(weights)
+    fragment_sizes = [0] * NUM_WORKERS
+    fragment_loads = [0] * NUM_WORKERS
+    # Ties on load go to the fragment with fewer entries, so equal weights still spread evenly
+    heap = [(0, 0, i) for i in range(NUM_WORKERS)]
+    
+    for idx in sorted(range(len(weights)), key=weights.__getitem__, reverse=True):
+        load, size, i = heapq.heappop(heap)
+        assignment[idx] = i
+        fragment_loads[i] = load + weights[idx]
+        fragment_sizes[i] = size + 1
+        heapq.heappush(heap, (fragment_loads[i], fragment_sizes[i], i))
+    
+    return assignment, fragment_sizes, fragment_loads
+
+def iter_entries(data_structure, list_field_name):
+    """Stream the entries of the input file one at a time."""
+    prefix = "item" if data_structure == "list" else f"{list_field_name}.item"
+    with open(INPUT_FILE, 'rb') as f:
+        yield from ijson.items(f, prefix, use_float=True)
+
+def load_and_split_data():
+    """Stream the JSON dataset and split it into fragments."""
+    logger.info(f"Loading data from {INPUT_FILE}")
+    
+    try:
+        data_structure, list_field_name, data, weights = scan_input()
+        logger.info(f"Loaded {len(weights)} entries, detected structure: {data_structure}")
         
-        fragment_sizes = [base_size + (1 if i < remainder else 0) for i in range(NUM_WORKERS)]
+        # Balance fragments by prompt length rather than entry count
+        assignment, fragment_sizes, fragment_loads = balance_fragments(weights)
         logger.info(f"Fragment sizes: {fragment_sizes}")
+        logger.info(f"Fragment prompt lengths: {fragment_loads}")
         
-        # Create fragments
-        start_idx = 0
-        fragments = []
+        # The wrapper is stored once in the manifest, fragments are plain arrays of entries
+        manifest = {
+            "data_structure": data_structure,
+            "list_field_name": list_field_name,
+            "wrapper": data if data_structure in ("dict_with_data", "dict_with_list") else None
+        }
+        with open(MANIFEST_FILE, 'wb') as f:
+            f.write(orjson.dumps(manifest))
+        
+        # Create fragments, streaming each entry straight into its fragment file
+        if data_structure == "single_object":
+            entries = iter([data])
+        else:
+            entries = iter_entries(data_structure, list_field_name)
+        fragment_files = [f"{FRAGMENT_DIR}/fragment_{worker_id+1}.json" for worker_id in range(NUM_WORKERS)]
+        
+        fds = [os.open(fragment_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644) for fragment_file in fragment_files]
+        buffers = [bytearray(b"[") for _ in fragment_files]
+        pending = [None] * NUM_WORKERS
+        written = [0] * NUM_WORKERS
+        
+        try:
+            # Hand full buffers to a thread pool so writes to different fragments overlap with parsing
+            with ThreadPoolExecutor(max_workers=min(NUM_WORKERS, 8)) as pool:
+                def flush(i):
+                    # Chunks of one fragment must land in order, so wait for its previous write
+                    if pending[i] is not None:
+                        pending[i].result()
+                    pending[i] = pool.submit(write_fragment_chunk, fds[i], bytes(buffers[i]))
+                    buffers[i].clear()
+                
+                for idx, entry in enumerate(entries):
+                    i = assignment[idx]
+                    if written[i]:
+                        buffers[i] += b","
+                    # Tag entries with their position so results can be put back in order,
+                    # an untagged entry would end up in the wrong place when results are merged
+                    if not isinstance(entry, dict):
+                        raise ValueError(f"Entry {idx} is a {type(entry).__name__}, only JSON objects can be enhanced")
+                    entry["_idx"] = idx
+                    buffers[i] += orjson.dumps(entry)
+                    written[i] += 1
+                    if len(buffers[i]) >= FRAGMENT_WRITE_CHUNK:
+                        flush(i)
+                
+                for i in range(NUM_WORKERS):
+                    buffers[i] += b"]"
+                    flush(i)
+                for future in pending:
+                    future.result()
+        finally:
+            for fd in fds:
+                os.close(fd)
         
+        fragments = []
         for worker_id in range(NUM_WORKERS):
             size = fragment_sizes[worker_id]
-            end_idx = start_idx + size
-            fragment = entries[start_idx:end_idx]
-            fragment_file = f"{FRAGMENT_DIR}/fragment_{worker_id+1}.json"
-            
-            # Save fragment with original structure
-            if data_structure == "list":
-                with open(fragment_file, 'w') as f:
-                    json.dump(fragment, f)
-            elif data_structure == "dict_with_data":
-                fragment_data = data.copy()
-                fragment_data["data"] = fragment
-                with open(fragment_file, 'w') as f:
-                    json.dump(fragment_data, f)
-            elif data_structure == "dict_with_list":
-                fragment_data = data.copy()
-                fragment_data[list_field_name] = fragment
-                with open(fragment_file, 'w') as f:
-                    json.dump(fragment_data, f)
-            else:  # single_object
-                with open(fragment_file, 'w') as f:
-                    json.dump(fragment[0] if fragment else {}, f)
-            
+            fragment_file = fragment_files[worker_id]
             logger.info(f"Created fragment {worker_id+1} with {size} entries at {fragment_file}")
             fragments.append({
                 "worker_id": worker_id + 1,
                 "file": fragment_file,
-                "size": size,
-                "start_idx": start_idx,
-                "end_idx": end_idx
+                "size": size
             })
             
             # Initialize worker status
+            worker_done[worker_id + 1] = threading.Event()
             worker_status[worker_id + 1] = {
                 "status": "Ready",
                 "progress": 0,
@@ -127,157 +292,309 @@ def load_and_split_data():
                 "stage": "Not started",
                 "last_update": time.time()
             }
-            
-            start_idx = end_idx
         
-        return fragments, data_structure, data
+        GLOBAL_TOTALS["total"] = sum(fragment_sizes)
+        GLOBAL_TOTALS["processed"] = 0
+        
+        return fragments, manifest
     
     except Exception as e:
         logger.error(f"Error loading data: {e}")
         raise
 
-def monitor_worker_log(worker_id):
-    """Monitor the log file of a specific worker and update its status."""
+def set_worker_progress(worker_id, progress, total):
+    """Update a worker's counts and the overall totals by the difference (caller holds status_lock)."""
+    GLOBAL_TOTALS["processed"] += progress - worker_status[worker_id]["progress"]
+    GLOBAL_TOTALS["total"] += total - worker_status[worker_id]["total"]
+    worker_status[worker_id]["progress"] = progress
+    worker_status[worker_id]["total"] = total
+
+def update_status_from_log(worker_id, line):
+    """Update a worker's status based on a single log line."""
+    with status_lock:
+        worker_logs[worker_id].append(line.strip())
+        
+        # Update status based on log content
+        match = LOG_LINE_PATTERN.search(line)
+        if match:
+            kind = match.lastgroup
+            if kind in LOG_STAGES:
+                worker_status[worker_id]["stage"] = LOG_STAGES[kind]
+            elif kind == "prog":
+                # Extract progress information
+                set_worker_progress(worker_id, int(match.group("current")), int(match.group("total")))
+                worker_status[worker_id]["status"] = "Processing"
+            elif kind == "done":
+                worker_status[worker_id]["status"] = "Completed"
+                set_worker_progress(worker_id, worker_status[worker_id]["total"], worker_status[worker_id]["total"])
+                worker_status[worker_id]["completed"] = True
+                worker_done[worker_id].set()
+        
+        worker_status[worker_id]["last_update"] = time.time()
+
+def mark_worker_completed(worker_id):
+    """Mark a worker as completed once its result file exists."""
+    with status_lock:
+        if worker_status[worker_id].get("completed", False):
+            return
+        worker_status[worker_id]["status"] = "Completed"
+        set_worker_progress(worker_id, worker_status[worker_id]["total"], worker_status[worker_id]["total"])
+        worker_status[worker_id]["completed"] = True
+        worker_done[worker_id].set()
+    logger.info(f"Worker {worker_id} completed (detected by result file)")
+    status_updates.put(worker_id)
+
+def read_worker_log(worker_id):
+    """Apply any complete lines appended to a worker log since the last read."""
     log_file = f"{RESULT_DIR}/worker_{worker_id}.log"
-    last_position = 0
+    try:
+        stat = os.stat(log_file)
+    except FileNotFoundError:
+        return
+    
+    fd = log_fds.get(worker_id)
+    if fd is not None:
+        fd_stat = os.fstat(fd)
+        if fd_stat.st_ino != stat.st_ino or stat.st_size < os.lseek(fd, 0, os.SEEK_CUR):
+            # The log was replaced or truncated, follow the new file from the start
+            close_worker_log(worker_id)
+            fd = None
+    if fd is None:
+        fd = os.open(log_file, os.O_RDONLY | os.O_NONBLOCK)
+        log_fds[worker_id] = fd
     
-    while not worker_status[worker_id].get("completed", False):
+    buffer = log_buffers[worker_id]
+    while True:
         try:
-            if os.path.exists(log_file):
-                with open(log_file, 'r') as f:
-                    f.seek(last_position)
-                    new_lines = f.readlines()
-                    if new_lines:
-                        last_position = f.tell()
-                        for line in new_lines:
-                            with status_lock:
-                                worker_logs[worker_id].append(line.strip())
-                                
-                                # Update status based on log content
-                                if "Starting Ollama" in line:
-                                    worker_status[worker_id]["stage"] = "Starting Ollama"
-                                elif "Pulling model" in line:
-                                    worker_status[worker_id]["stage"] = "Pulling model"
-                                elif "Ollama service is running" in line:
-                                    worker_status[worker_id]["stage"] = "Ollama ready"
-                                elif "processing fragment" in line:
-                                    worker_status[worker_id]["stage"] = "Processing"
-                                elif "Processed " in line and "entries" in line:
-                                    # Extract progress information
-                                    try:
-                                        parts = line.split("Processed ")[1].split()
-                                        if "/" in parts[0]:
-                                            current, total = map(int, parts[0].split("/"))
-                                            worker_status[worker_id]["progress"] = current
-                                            worker_status[worker_id]["total"] = total
-                                            worker_status[worker_id]["status"] = "Processing"
-                                    except:
-                                        pass
-                                elif "Processing completed" in line:
-                                    worker_status[worker_id]["status"] = "Completed"
-                                    worker_status[worker_id]["progress"] = worker_status[worker_id]["total"]
-                                    worker_status[worker_id]["completed"] = True
-                                
-                                worker_status[worker_id]["last_update"] = time.time()
-            
-            time.sleep(1)
+            chunk = os.read(fd, 65536)
+        except BlockingIOError:
+            break
+        if not chunk:
+            break
+        buffer += chunk
+    
+    # Keep a trailing partial line buffered until the rest of it is written
+    end = buffer.rfind(b"\n")
+    if end < 0:
+        return
+    new_lines = buffer[:end].decode(errors="replace").split("\n")
+    del buffer[:end + 1]
+    
+    for line in new_lines:
+        update_status_from_log(worker_id, line)
+    status_updates.put(worker_id)
+
+def close_worker_log(worker_id):
+    """Close the cached descriptor for a worker log and drop any buffered partial line."""
+    fd = log_fds.pop(worker_id, None)
+    if fd is not None:
+        os.close(fd)
+    log_buffers.pop(worker_id, None)
+
+def wait_for_worker(worker_id):
+    """Block until a worker is done, checking for its result file now and then in case an event was missed."""
+    while not worker_done[worker_id].wait(timeout=RESULT_POLL_INTERVAL):
+        if os.path.exists(f"{RESULT_DIR}/result_{worker_id}.json"):
+            mark_worker_completed(worker_id)
+
+def wait_for_all_workers():
+    """Set all_done once every worker has finished, waking the display."""
+    for worker_id in worker_done:
+        wait_for_worker(worker_id)
+    all_done.set()
+    status_updates.put(None)
+
+def monitor_worker_log(worker_id):
+    """Monitor the log file of a specific worker and update its status (polling fallback)."""
+    while not worker_done[worker_id].is_set():
+        try:
+            read_worker_log(worker_id)
+            worker_done[worker_id].wait(timeout=1)
         except Exception as e:
             logger.error(f"Error monitoring worker {worker_id} log: {e}")
-            time.sleep(5)
+            worker_done[worker_id].wait(timeout=5)
+    close_worker_log(worker_id)
 
-def display_status():
-    """Display the status of all workers in a clear format."""
-    while not all(worker.get("completed", False) for worker in worker_status.values()):
-        # Clear screen
-        os.system('cls' if os.name == 'nt' else 'clear')
-        
-        print("\n" + "="*80)
-        print(f"VULNERABILITY ENHANCEMENT PROCESSING - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print("="*80)
-        
-        # Display overall progress
-        total_entries = sum(worker["total"] for worker in worker_status.values())
-        processed_entries = sum(worker["progress"] for worker in worker_status.values())
-        overall_percentage = (processed_entries / total_entries * 100) if total_entries > 0 else 0
+def poll_workers(fragments):
+    """Poll worker logs and result files until all workers complete."""
+    for fragment in fragments:
+        thread = threading.Thread(target=monitor_worker_log, args=(fragment["worker_id"],))
+        thread.daemon = True
+        thread.start()
+    
+    while not all_done.is_set():
+        # Check for result files as a backup completion indicator
+        for fragment in fragments:
+            worker_id = fragment["worker_id"]
+            if os.path.exists(f"{RESULT_DIR}/result_{worker_id}.json"):
+                mark_worker_completed(worker_id)
         
-        print(f"\nOVERALL PROGRESS: {processed_entries}/{total_entries} entries ({overall_percentage:.1f}%)")
-        print("-"*80)
+        all_done.wait(timeout=5)
+
+def watch_workers(fragments):
+    """Follow worker logs and result files with a single inotify watch on RESULT_DIR."""
+    inotify = INotify()
+    # Workers publish result files with os.replace, which only shows up as MOVED_TO
+    inotify.add_watch(RESULT_DIR, flags.MODIFY | flags.CREATE | flags.CLOSE_WRITE | flags.MOVED_TO)
+    
+    def catch_up():
+        for fragment in fragments:
+            worker_id = fragment["worker_id"]
+            read_worker_log(worker_id)
+            if os.path.exists(f"{RESULT_DIR}/result_{worker_id}.json"):
+                mark_worker_completed(worker_id)
+    
+    try:
+        # Catch up on anything written before the watch was added
+        catch_up()
         
-        # Display status for each worker
-        print("\nWORKER STATUS:")
-        for worker_id, status in sorted(worker_status.items()):
-            stage = status["stage"]
-            progress = status["progress"]
-            total = status["total"]
-            percentage = (progress / total * 100) if total > 0 else 0
-            
-            # Calculate time since last update
-            idle_time = time.time() - status["last_update"]
-            idle_indicator = " (!)" if idle_time > 60 else ""
-            
-            # Create a progress bar
-            bar_length = 30
-            filled_length = int(bar_length * percentage / 100)
-            bar = '█' * filled_length + '░' * (bar_length - filled_length)
-            
-            print(f"Worker {worker_id}: [{bar}] {percentage:.1f}% - {stage} ({progress}/{total}){idle_indicator}")
+        while not all_done.is_set():
+            # Timeout only lets us notice all_done; we otherwise sleep until an event arrives
+            for event in inotify.read(timeout=1000):
+                if event.mask & flags.Q_OVERFLOW:
+                    # Events were dropped, rescan everything
+                    catch_up()
+                    continue
+                
+                match = LOG_FILE_PATTERN.match(event.name)
+                if match:
+                    worker_id = int(match.group(1))
+                    if worker_id in worker_status:
+                        try:
+                            read_worker_log(worker_id)
+                        except Exception as e:
+                            logger.error(f"Error monitoring worker {worker_id} log: {e}")
+                    continue
+                
+                # Only trust result files once the worker has finished writing or renamed them into place
+                match = RESULT_FILE_PATTERN.match(event.name)
+                if match and event.mask & (flags.CLOSE_WRITE | flags.MOVED_TO):
+                    worker_id = int(match.group(1))
+                    if worker_id in worker_status:
+                        mark_worker_completed(worker_id)
+    finally:
+        inotify.close()
+        for fragment in fragments:
+            close_worker_log(fragment["worker_id"])
+
+# ANSI sequences used to repaint the status screen in place
+CURSOR_HOME_CLEAR = "\x1b[H\x1b[J"
+HIDE_CURSOR = "\x1b[?25l"
+SHOW_CURSOR = "\x1b[?25h"
+
+def render_status():
+    """Build the full status screen as a single string."""
+    lines = []
+    lines.append("\n" + "="*80)
+    lines.append(f"VULNERABILITY ENHANCEMENT PROCESSING - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    lines.append("="*80)
+    
+    # Display overall progress
+    total_entries = GLOBAL_TOTALS["total"]
+    processed_entries = GLOBAL_TOTALS["processed"]
+    overall_percentage = (processed_entries / total_entries * 100) if total_entries > 0 else 0
+    
+    lines.append(f"\nOVERALL PROGRESS: {processed_entries}/{total_entries} entries ({overall_percentage:.1f}%)")
+    lines.append("-"*80)
+    
+    # Display status for each worker
+    lines.append("\nWORKER STATUS:")
+    for worker_id, status in sorted(worker_status.items()):
+        stage = status["stage"]
+        progress = status["progress"]
+        total = status["total"]
+        percentage = (progress / total * 100) if total > 0 else 0
         
-        print("\nLATEST LOGS:")
-        for worker_id in sorted(worker_logs.keys()):
-            # Show the last 2 log entries for each worker
-            logs = worker_logs[worker_id][-2:] if worker_logs[worker_id] else []
-            if logs:
-                print(f"Worker {worker_id}:", end=" ")
-                print(logs[-1] if len(logs) == 1 else f"{logs[-2]} → {logs[-1]}")
+        # Calculate time since last update
+        idle_time = time.time() - status["last_update"]
+        idle_indicator = " (!)" if idle_time > 60 else ""
         
-        print("\nPress Ctrl+C to exit monitoring (processing will continue)")
-        print("="*80)
+        # Create a progress bar
+        bar_length = 30
+        filled_length = int(bar_length * percentage / 100)
+        bar = '█' * filled_length + '░' * (bar_length - filled_length)
         
-        time.sleep(2)
+        lines.append(f"Worker {worker_id}: [{bar}] {percentage:.1f}% - {stage} ({progress}/{total}){idle_indicator}")
+    
+    lines.append("\nLATEST LOGS:")
+    for worker_id in sorted(worker_logs.keys()):
+        # Show the last 2 log entries for each worker
+        logs = list(worker_logs[worker_id])[-2:] if worker_logs[worker_id] else []
+        if logs:
+            lines.append(f"Worker {worker_id}: " + (logs[-1] if len(logs) == 1 else f"{logs[-2]} → {logs[-1]}"))
+    
+    lines.append("\nPress Ctrl+C to exit monitoring (processing will continue)")
+    lines.append("="*80)
+    return "\n".join(lines) + "\n"
+
+def render_summary():
+    """Build a one-line progress summary for non-interactive output."""
+    total_entries = GLOBAL_TOTALS["total"]
+    processed_entries = GLOBAL_TOTALS["processed"]
+    overall_percentage = (processed_entries / total_entries * 100) if total_entries > 0 else 0
+    return f"OVERALL PROGRESS: {processed_entries}/{total_entries} entries ({overall_percentage:.1f}%)"
+
+def display_status():
+    """Display the status of all workers in a clear format."""
+    interactive = sys.stdout.isatty()
+    last_summary = None
+    if interactive:
+        sys.stdout.write(HIDE_CURSOR)
+    
+    try:
+        while not all_done.is_set():
+            if interactive:
+                # Repaint in place instead of spawning a shell to clear the screen
+                sys.stdout.write(CURSOR_HOME_CLEAR + render_status())
+                sys.stdout.flush()
+            else:
+                summary = render_summary()
+                if summary != last_summary:
+                    print(summary, flush=True)
+                    last_summary = summary
+            
+            # Redraw as soon as a worker reports something (at least every 2s for idle indicators)
+            try:
+                status_updates.get(timeout=2)
+                while True:
+                    status_updates.get_nowait()
+            except queue.Empty:
+                pass
+    finally:
+        if interactive:
+            sys.stdout.write(SHOW_CURSOR)
+            sys.stdout.flush()
     
     # Final status after completion
-    os.system('cls' if os.name == 'nt' else 'clear')
-    print("\n" + "="*80)
-    print(f"PROCESSING COMPLETED - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("="*80)
-    print("\nAll workers have completed processing!")
-    print(f"Enhanced data saved to {OUTPUT_FILE}")
-    print("="*80 + "\n")
+    frame = [
+        "\n" + "="*80,
+        f"PROCESSING COMPLETED - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        "="*80,
+        "\nAll workers have completed processing!",
+        f"Enhanced data saved to {OUTPUT_FILE}",
+        "="*80 + "\n",
+    ]
+    sys.stdout.write((CURSOR_HOME_CLEAR if interactive else "") + "\n".join(frame) + "\n")
+    sys.stdout.flush()
 
 def monitor_workers(fragments):
     """Monitor the progress of worker containers."""
     logger.info("Starting worker monitoring")
     
-    # Create monitoring threads for each worker
-    threads = []
-    for fragment in fragments:
-        worker_id = fragment["worker_id"]
-        thread = threading.Thread(target=monitor_worker_log, args=(worker_id,))
-        thread.daemon = True
-        thread.start()
-        threads.append(thread)
-    
     # Start the display thread
     display_thread = threading.Thread(target=display_status)
     display_thread.daemon = True
     display_thread.start()
     
+    # Follow worker logs and result files in the background
+    watcher = watch_workers if INotify is not None and sys.platform.startswith("linux") else poll_workers
+    threading.Thread(target=watcher, args=(fragments,), daemon=True).start()
+    threading.Thread(target=wait_for_all_workers, daemon=True).start()
+    
     # Wait for all workers to complete
     try:
-        while not all(worker.get("completed", False) for worker in worker_status.values()):
-            # Check for result files as a backup completion indicator
-            for fragment in fragments:
-                worker_id = fragment["worker_id"]
-                result_file = f"{RESULT_DIR}/result_{worker_id}.json"
-                
-                if os.path.exists(result_file) and not worker_status[worker_id].get("completed", False):
-                    logger.info(f"Worker {worker_id} completed (detected by result file)")
-                    with status_lock:
-                        worker_status[worker_id]["status"] = "Completed"
-                        worker_status[worker_id]["progress"] = worker_status[worker_id]["total"]
-                        worker_status[worker_id]["completed"] = True
-            
-            time.sleep(5)
+        for worker_id in worker_done:
+            wait_for_worker(worker_id)
     except KeyboardInterrupt:
         logger.info("Monitoring interrupted by user")
     
@@ -288,58 +605,57 @@ def monitor_workers(fragments):
     
     return True
 
-def combine_results(fragments, data_structure, original_data):
+def output_envelope(manifest):
+    """Return the bytes written before and after the combined entries."""
+    if manifest["data_structure"] == "list":
+        return b"[", b"]"
+    
+    envelope = manifest["wrapper"].copy()
+    envelope[manifest["list_field_name"]] = ENTRIES_PLACEHOLDER
+    prefix, suffix = orjson.dumps(envelope).split(orjson.dumps(ENTRIES_PLACEHOLDER), 1)
+    return prefix + b"[", b"]" + suffix
+
+def iter_result_entries(worker_id):
+    """Stream the entries of a worker's result file one at a time."""
+    with open(f"{RESULT_DIR}/result_{worker_id}.json", 'rb') as f:
+        yield from ijson.items(f, "item", use_float=True)
+
+def entry_order(entry):
+    """Original position of an entry, from the index added at split time."""
+    if not isinstance(entry, dict) or "_idx" not in entry:
+        raise ValueError(f"Result entry without its split-time index, cannot restore the original order: {entry!r:.100}")
+    return entry["_idx"]
+
+def combine_results(fragments, manifest):
     """Combine results from all workers into a single output file."""
     logger.info("Combining results from all workers")
     
     try:
-        combined_entries = []
+        # Results keep their fragment's order, so merging on the split-time index restores the original order
+        streams = [iter_result_entries(fragment["worker_id"]) for fragment in fragments]
+        merged = heapq.merge(*streams, key=entry_order)
         
-        for fragment in fragments:
-            worker_id = fragment["worker_id"]
-            result_file = f"{RESULT_DIR}/result_{worker_id}.json"
-            
-            with open(result_file, 'r') as f:
-                result_data = json.load(f)
-            
-            # Extract entries based on data structure
-            if data_structure == "list":
-                entries = result_data
-            elif data_structure == "dict_with_data":
-                entries = result_data["data"]
-            elif data_structure == "dict_with_list":
-                list_fields = [k for k, v in result_data.items() if isinstance(v, list)]
-                if list_fields:
-                    entries = result_data[list_fields[0]]
-                else:
-                    entries = []
-            else:  # single_object
-                entries = [result_data]
-            
-            logger.info(f"Adding {len(entries)} entries from worker {worker_id}")
-            combined_entries.extend(entries)
-        
-        # Sort entries by their original order if needed
-        # This assumes entries have some index or identifier to restore original order
-        
-        # Create final output with original structure
-        if data_structure == "list":
-            final_data = combined_entries
-        elif data_structure == "dict_with_data":
-            final_data = original_data.copy()
-            final_data["data"] = combined_entries
-        elif data_structure == "dict_with_list":
-            final_data = original_data.copy()
-            list_fields = [k for k, v in original_data.items() if isinstance(v, list)]
-            if list_fields:
-                final_data[list_fields[0]] = combined_entries
-        else:  # single_object
-            final_data = combined_entries[0] if combined_entries else {}
-        
-        # Save combined results
-        with open(OUTPUT_FILE, 'w') as f:
-            json.dump(final_data, f, indent=2)
+        # Stream entries straight into the output with the original structure from the manifest
+        with open(OUTPUT_FILE, 'wb') as out:
+            if manifest["data_structure"] == "single_object":
+                entry = next(merged, {})
+                if isinstance(entry, dict):
+                    entry.pop("_idx", None)
+                out.write(orjson.dumps(entry, option=orjson.OPT_INDENT_2))
+                count = 1
+            else:
+                prefix, suffix = output_envelope(manifest)
+                out.write(prefix)
+                count = 0
+                for entry in merged:
+                    if isinstance(entry, dict):
+                        entry.pop("_idx", None)
+                    out.write(b",\n" if count else b"\n")
+                    out.write(orjson.dumps(entry))
+                    count += 1
+                out.write(b"\n" + suffix)
         
+        logger.info(f"Combined {count} entries from {len(fragments)} workers")
         logger.info(f"Combined results saved to {OUTPUT_FILE}")
         
     except Exception as e:
@@ -352,13 +668,13 @@ def main():
     
     try:
         # Split data into fragments
-        fragments, data_structure, original_data = load_and_split_data()
+        fragments, manifest = load_and_split_data()
         
         # Monitor workers until completion
         monitor_workers(fragments)
         
         # Combine results
-        combine_results(fragments, data_structure, original_data)
+        combine_results(fragments, manifest)
         
         end_time = datetime.now()
         duration = end_time - start_time
@@ -9,11 +9,15 @@ This script:
 4. Saves results back to a shared volume
 """
 
-import json
+import orjson
 import time
+import hashlib
 import os
+import asyncio
 import subprocess
+import threading
 import logging
+import httpx
 import ollama
 from tqdm import tqdm
 
@@ -34,152 +38,211 @@ MODEL_NAME = os.environ.get('MODEL_NAME', 'phi:mini')
 FRAGMENT_DIR = "/data/fragments"
 RESULT_DIR = "/results/fragments"
 GPU_MEMORY_LIMIT = int(os.environ.get('GPU_MEMORY_LIMIT', 2048))  # In MB
+# In-flight Ollama requests per batch, by default as many as the server serves in parallel
+CONCURRENCY = int(os.environ.get('CONCURRENCY', os.environ.get('OLLAMA_NUM_PARALLEL', 4)))
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://127.0.0.1:11434')
+NUM_CTX = int(os.environ.get('NUM_CTX', 2048))  # Context window per request, keeps KV cache small
+KEEP_ALIVE = os.environ.get('KEEP_ALIVE', '30m')  # Keep the model loaded between requests
+READY_TIMEOUT = int(os.environ.get('READY_TIMEOUT', 900))  # Seconds to wait for the server and model pull
 
 # Input and output files
 INPUT_FILE = f"{FRAGMENT_DIR}/fragment_{WORKER_ID}.json"
 OUTPUT_FILE = f"{RESULT_DIR}/result_{WORKER_ID}.json"
+PROGRESS_JSONL = f"{OUTPUT_FILE}.jsonl"  # Append-only log of processed entries and their fingerprints
+PROGRESS_JSONL_TMP = f"{PROGRESS_JSONL}.tmp"  # Log being written by the current run, replaces PROGRESS_JSONL at the end
 
-def enhance_description(entry):
-    """Enhance a vulnerability description using the Ollama Python library."""
-    original_output = entry.get("output", "")
-    code_sample = entry.get("input", "")
+MAX_RETRIES = 3
+BACKOFF_STATUS_CODES = (429, 503)  # Ollama is busy, back off before retrying
 
-    # Create prompt for the model
-    prompt = f"""You are a cybersecurity expert. Improve the following vulnerability explanation by:
+# Fixed instructions are sent as the system message so Ollama can reuse the prefix
+SYSTEM_PROMPT = """You are a cybersecurity expert. Improve the vulnerability explanation given by the user by:
 1. Fixing grammar and sentence structure
 2. Making the description more clear and descriptive
 3. Ensuring proper technical explanations while keeping the same structure
 4. Maintaining all technical details (CWE numbers, line numbers, function names)
 5. The description should be a minimum of 2 lines
 
-The vulnerability relates to this code:
-```c
-{code_sample}
-```
+Reply with the enhanced description only."""
+
+# Constant pieces of the per-entry user prompt, around the code sample and original description
+USER_PROMPT_HEADER = "The vulnerability relates to this code:\n```c\n"
+USER_PROMPT_MID = "\n```\n\nOriginal vulnerability description:\n"
+USER_PROMPT_TAIL = "\n\nEnhanced description:"
+PROMPT_DIGEST = hashlib.blake2b("\0".join((SYSTEM_PROMPT, USER_PROMPT_HEADER, USER_PROMPT_MID, USER_PROMPT_TAIL)).encode(), digest_size=8).hexdigest()
+
+# Shared clients, ASYNC_CLIENT serves every enhancement over one keep-alive connection pool
+# and CLIENT only backs the readiness checks
+HTTP_TIMEOUT = httpx.Timeout(120.0, connect=2.0)
+CLIENT = ollama.Client(host=OLLAMA_HOST, timeout=HTTP_TIMEOUT)
+ASYNC_CLIENT = ollama.AsyncClient(host=OLLAMA_HOST, timeout=HTTP_TIMEOUT)
+
+def build_chat_request(entry):
+    """Build the ollama.chat arguments for an entry."""
+    original_output = entry.get("output", "")
+    code_sample = entry.get("input", "")
+
+    # Only the per-entry part of the prompt changes between requests
+    user_prompt = f"{USER_PROMPT_HEADER}{code_sample}{USER_PROMPT_MID}{original_output}{USER_PROMPT_TAIL}"
+
+    return {
+        "model": MODEL_NAME,  # The model pulled by start-ollama.sh
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        "options": {
+            "temperature": 0.3,
+            "num_predict": 512,
+            "num_ctx": NUM_CTX
+        },
+        "keep_alive": KEEP_ALIVE
+    }
+
+def apply_response(entry, response):
+    """Create a new entry with the enhanced output from an ollama.chat response."""
+    updated_entry = entry.copy()
+    updated_entry["output"] = response["message"]["content"].strip()
+    return updated_entry
 
-Original vulnerability description:
-{original_output}
+def retry_delay(error, retry):
+    """Seconds to wait before retrying after an error."""
+    if getattr(error, "status_code", None) in BACKOFF_STATUS_CODES:
+        return 2 ** retry  # Exponential back off while Ollama is saturated
+    return 2
 
-Enhanced description:"""
+async def enhance_description_async(client, sem, entry):
+    """Enhance a vulnerability description with the async Ollama client, gated by a shared semaphore."""
+    request = build_chat_request(entry)
 
-    max_retries = 3
-    for retry in range(max_retries):
+    for retry in range(MAX_RETRIES):
         try:
-            # Use the ollama.chat function to get a response
-            response = ollama.chat(
-                model="gemma3:1b-it-qat",  # Use the preset model name
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                options={
-                    "temperature": 0.3,
-                    "num_predict": 512
-                }
-            )
-            
-            # Extract the enhanced description
-            enhanced_output = response["message"]["content"].strip()
-            
-            # Create a new entry with the enhanced output
-            updated_entry = entry.copy()
-            updated_entry["output"] = enhanced_output
-            return updated_entry
-            
+            async with sem:
+                response = await client.chat(**request)
+            return apply_response(entry, response)
+
         except Exception as e:
-            logger.warning(f"Exception in ollama.chat: {e} (Retry {retry+1}/{max_retries})")
-            # On error, list available models for debugging
-            try:
-                models = ollama.list()
-                logger.info(f"Available models: {models}")
-            except Exception as list_err:
-                logger.warning(f"Could not list models: {list_err}")
-            time.sleep(2)
+            logger.warning(f"Exception in ollama.chat: {e} (Retry {retry+1}/{MAX_RETRIES})")
+            await asyncio.sleep(retry_delay(e, retry))
 
     # If all retries fail, keep the original entry
-    logger.error(f"Failed to process entry after {max_retries} attempts - keeping original")
+    logger.error(f"Failed to process entry after {MAX_RETRIES} attempts - keeping original")
     return entry
 
+async def _process_batch_async(batch):
+    """Enhance a batch of entries with up to CONCURRENCY requests in flight."""
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def _one(entry):
+        return await enhance_description_async(ASYNC_CLIENT, sem, entry)
+
+    # gather preserves the order of the batch
+    return await asyncio.gather(*(_one(entry) for entry in batch))
+
+def fingerprint(entry):
+    """Cheap fingerprint of the model, prompt and fields an enhancement depends on."""
+    key = "\0".join((MODEL_NAME, PROMPT_DIGEST, str(entry.get('input', '')), str(entry.get('output', ''))))
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+def load_enhanced_entries():
+    """Map fingerprints to enhanced entries from earlier runs' JSONL checkpoints."""
+    done = {}
+    # The temp log holds whatever an interrupted run enhanced before it could replace PROGRESS_JSONL
+    for path in (PROGRESS_JSONL, PROGRESS_JSONL_TMP):
+        if not os.path.exists(path):
+            continue
+        
+        with open(path, 'rb') as f:
+            for line in f:
+                # A crash can leave a partially written last line behind
+                if not line.endswith(b"\n"):
+                    break
+                record = orjson.loads(line)
+                if record["fp"] is not None:
+                    done[record["fp"]] = record["entry"]
+    return done
+
+def write_atomic(path, data):
+    """Write data to path via a fsynced temp file, so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
 def process_fragment():
     """Process the assigned fragment of the dataset."""
     logger.info(f"Worker {WORKER_ID} starting to process fragment {INPUT_FILE}")
     
     try:
-        # Load fragment data
-        with open(INPUT_FILE, 'r') as f:
-            data = json.load(f)
+        # Load fragment data, a plain array of entries (the wrapper stays in the master's manifest)
+        with open(INPUT_FILE, 'rb') as f:
+            entries = orjson.loads(f.read())
         
-        # Determine data structure
-        if isinstance(data, list):
-            entries = data
-            data_structure = "list"
-        elif isinstance(data, dict) and "data" in data:
-            entries = data["data"]
-            data_structure = "dict_with_data"
-        else:
-            # Try to find any list field in the JSON
-            list_fields = [k for k, v in data.items() if isinstance(v, list)]
-            if list_fields:
-                entries = data[list_fields[0]]
-                data_structure = "dict_with_list"
-                list_field_name = list_fields[0]
-            else:
-                entries = [data]  # Treat the whole JSON as a single entry
-                data_structure = "single_object"
+        total = len(entries)
+        logger.info(f"Loaded {total} entries")
         
-        logger.info(f"Loaded {len(entries)} entries, detected structure: {data_structure}")
+        # Entries already enhanced by an earlier run are reused instead of sent to the LLM again
+        done = load_enhanced_entries()
+        if done:
+            logger.info(f"Found {len(done)} already enhanced entries in {PROGRESS_JSONL}")
         
         # Process entries
-        result_entries = []
-        batch_size = 10  # Process in small batches and save progress
+        batch_size = max(10, CONCURRENCY)  # Process in small batches and save progress
+        reused = 0
         
-        for i in tqdm(range(0, len(entries), batch_size)):
-            batch = entries[i:min(i+batch_size, len(entries))]
-            batch_results = []
-            
-            for entry in batch:
-                # Process each entry
-                processed_entry = enhance_description(entry)
-                batch_results.append(processed_entry)
-                # Brief pause to avoid overwhelming Ollama
-                time.sleep(0.1)
-            
-            # Add processed batch to results
-            result_entries.extend(batch_results)
-            
-            # Save intermediate results
-            if data_structure == "list":
-                intermediate_data = result_entries
-            elif data_structure == "dict_with_data":
-                intermediate_data = data.copy()
-                intermediate_data["data"] = result_entries
-            elif data_structure == "dict_with_list":
-                intermediate_data = data.copy()
-                intermediate_data[list_field_name] = result_entries
-            else:  # single_object
-                intermediate_data = result_entries[0] if result_entries else {}
-            
-            with open(f"{OUTPUT_FILE}.temp", 'w') as f:
-                json.dump(intermediate_data, f, indent=2)
-            
-            # Log progress
-            processed = len(result_entries)
-            total = len(entries)
-            logger.info(f"Processed {processed}/{total} entries ({processed/total*100:.2f}%)")
+        # One event loop for the whole fragment so ASYNC_CLIENT keeps its connections between batches
+        # The previous log stays on disk untouched until this run has written a complete one
+        loop = asyncio.new_event_loop()
+        try:
+            with open(PROGRESS_JSONL_TMP, 'wb', buffering=1 << 20) as checkpoint:
+                for i in tqdm(range(0, total, batch_size)):
+                    batch = entries[i:min(i+batch_size, total)]
+                    fingerprints = [fingerprint(entry) for entry in batch]
+                    
+                    # Only entries without an earlier enhancement go to Ollama
+                    batch_results = [None] * len(batch)
+                    pending = []
+                    for j, (entry, fp) in enumerate(zip(batch, fingerprints)):
+                        if fp in done:
+                            batch_results[j] = entry.copy()
+                            batch_results[j]["output"] = done[fp]["output"]
+                            reused += 1
+                        else:
+                            pending.append(j)
+                    
+                    # Process the rest of the batch concurrently, bounded by CONCURRENCY
+                    if pending:
+                        enhanced = loop.run_until_complete(_process_batch_async([batch[j] for j in pending]))
+                        for j, processed_entry in zip(pending, enhanced):
+                            batch_results[j] = processed_entry
+                            # Failed entries come back unchanged and are retried on the next run
+                            if processed_entry is not batch[j]:
+                                done[fingerprints[j]] = processed_entry
+                    
+                    # Append the processed batch to the checkpoint
+                    for j, processed_entry in enumerate(batch_results):
+                        fp = fingerprints[j] if fingerprints[j] in done else None
+                        checkpoint.write(orjson.dumps({"fp": fp, "entry": processed_entry}) + b"\n")
+                    checkpoint.flush()
+                    
+                    # Log progress
+                    processed = i + len(batch)
+                    logger.info(f"Processed {processed}/{total} entries ({processed/total*100:.2f}%)")
+        finally:
+            loop.close()
+        
+        # Only now does the complete log of this run replace the previous one
+        os.replace(PROGRESS_JSONL_TMP, PROGRESS_JSONL)
         
-        # Save final results with original structure
-        if data_structure == "list":
-            final_data = result_entries
-        elif data_structure == "dict_with_data":
-            final_data = data.copy()
-            final_data["data"] = result_entries
-        elif data_structure == "dict_with_list":
-            final_data = data.copy()
-            final_data[list_field_name] = result_entries
-        else:  # single_object
-            final_data = result_entries[0] if result_entries else {}
+        if reused:
+            logger.info(f"Reused {reused} previously enhanced entries")
         
-        with open(OUTPUT_FILE, 'w') as f:
-            json.dump(final_data, f, indent=2)
+        with open(PROGRESS_JSONL, 'rb') as f:
+            result_entries = [orjson.loads(line)["entry"] for line in f]
+        
+        # Save final results as an array, mirroring the fragment
+        write_atomic(OUTPUT_FILE, orjson.dumps(result_entries, option=orjson.OPT_INDENT_2))
         
         logger.info(f"Processing completed. Results saved to {OUTPUT_FILE}")
         
@@ -187,13 +250,26 @@ def process_fragment():
         logger.error(f"Error processing fragment: {e}")
         raise
 
+# Delays between readiness probes while Ollama starts, the last one repeats
+READY_PROBE_DELAYS = (0.2, 0.4, 0.8, 1.6, 3.2, 5)
+
+def drain_output(process):
+    """Forward the start script's output to the worker log line by line."""
+    for line in process.stdout:
+        logger.info(f"[start-ollama] {line.rstrip()}")
+
+def model_available(models):
+    """Check whether MODEL_NAME shows up in an ollama.list() response."""
+    names = {model.get("model") or model.get("name") for model in models["models"]}
+    return MODEL_NAME in names or f"{MODEL_NAME}:latest" in names
+
 def start_ollama_with_bash():
     """Start Ollama using the bash script."""
     logger.info("Starting Ollama using the bash script")
     
     try:
-        # Run the bash script with environment variables
-        result = subprocess.run(
+        # Run the bash script with environment variables, streaming its output as it runs
+        process = subprocess.Popen(
             ["/app/start-ollama.sh"], 
             env={
                 **os.environ,
@@ -201,26 +277,40 @@ def start_ollama_with_bash():
                 "MODEL_NAME": MODEL_NAME,
                 "GPU_MEMORY_LIMIT": str(GPU_MEMORY_LIMIT)
             },
-            check=True
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1
         )
+        threading.Thread(target=drain_output, args=(process,), daemon=True).start()
         
-        if result.returncode == 0:
-            logger.info("Ollama started successfully via bash script")
-            # Verify we can connect using the Python library
+        # Probe the API with backoff; ready once the model is pulled, fail fast if the script dies
+        attempt = 0
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            returncode = process.poll()
+            if returncode is not None and returncode != 0:
+                logger.error(f"Bash script failed with return code {returncode}")
+                return False
+            
             try:
-                models = ollama.list()
-                logger.info(f"Successfully connected to Ollama using Python library. Available models: {models}")
-                return True
+                models = CLIENT.list()
+                if returncode == 0 or model_available(models):
+                    logger.info("Ollama started successfully via bash script")
+                    logger.info(f"Successfully connected to Ollama using Python library. Available models: {models}")
+                    return True
             except Exception as e:
-                logger.warning(f"Bash script succeeded but Python library connection failed: {e}")
-                return False
-        else:
-            logger.error(f"Bash script failed with return code {result.returncode}")
-            return False
+                if returncode == 0:
+                    logger.warning(f"Bash script succeeded but Python library connection failed: {e}")
+                    return False
             
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error running bash script: {e}")
+            time.sleep(READY_PROBE_DELAYS[min(attempt, len(READY_PROBE_DELAYS) - 1)])
+            attempt += 1
+        
+        logger.error(f"Ollama was not ready with {MODEL_NAME} after {READY_TIMEOUT}s, stopping the bash script")
+        process.kill()
         return False
+            
     except Exception as e:
         logger.error(f"Unexpected error starting Ollama: {e}")
         return False
@@ -229,7 +319,7 @@ def main():
     # Start Ollama service using bash script
     if not start_ollama_with_bash():
         logger.error("Cannot proceed without Ollama service")
-        return
+        raise SystemExit(1)
     
     # Process the fragment
     process_fragment()
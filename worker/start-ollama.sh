@@ -10,6 +10,13 @@ WORKER_ID=${WORKER_ID:-1}
 MODEL_NAME=${MODEL_NAME:-"phi:mini"}
 GPU_MEMORY_LIMIT=${GPU_MEMORY_LIMIT:-2048}
 
+# Address this worker's Ollama server listens on, the ollama CLI picks it up from the environment
+export OLLAMA_HOST=${OLLAMA_HOST:-"127.0.0.1:11434"}
+OLLAMA_URL=$OLLAMA_HOST
+if [[ $OLLAMA_URL != http* ]]; then
+    OLLAMA_URL="http://${OLLAMA_URL}"
+fi
+
 # Set up logging
 LOG_FILE="/results/fragments/ollama_${WORKER_ID}.log"
 mkdir -p $(dirname $LOG_FILE)
@@ -19,10 +26,11 @@ log() {
     echo "$(date +'%Y-%m-%d %H:%M:%S') - $1" | tee -a $LOG_FILE
 }
 
-# Check if Ollama is already running
-if pgrep -x "ollama" > /dev/null; then
-    log "Ollama is already running. Stopping it first..."
-    pkill -f "ollama" || true
+# Stop this worker's server from an earlier run, servers of other replicas on the host are left alone
+PID_FILE="/tmp/ollama_${WORKER_ID}.pid"
+if [ -f "$PID_FILE" ] && kill -0 "$(cat "$PID_FILE")" 2>/dev/null; then
+    log "Ollama for worker ${WORKER_ID} is already running. Stopping it first..."
+    kill "$(cat "$PID_FILE")" || true
     sleep 2
 fi
 
@@ -42,12 +50,18 @@ fi
 export OLLAMA_GPU_LAYERS=-1
 export OLLAMA_GPU_MEMORY=${GPU_MEMORY_LIMIT}MiB
 
+# Serve as many requests in parallel as the worker keeps in flight
+export OLLAMA_NUM_PARALLEL=${OLLAMA_NUM_PARALLEL:-4}
+
 # Start Ollama server with memory limits
 #log "Starting Ollama server with GPU memory limit: ${GPU_MEMORY_LIMIT}MB"
 #nohup ollama serve > "${LOG_FILE}.serve" 2>&1 &
 #OLLAMA_PID=$!
 
-ollama serve &
+# Server logs go to their own file so they don't flood the worker log
+ollama serve >> "${LOG_FILE}.serve" 2>&1 &
+OLLAMA_PID=$!
+echo $OLLAMA_PID > "$PID_FILE"
 
 echo "Waiting for Ollama server to be active..."
 while [ "$(ollama list | grep 'NAME')" == "" ]; do
@@ -71,11 +85,11 @@ success=false
 while [ $attempt -lt $max_attempts ]; do
     attempt=$((attempt+1))
     
-    if curl -s http://localhost:11434/api/tags > /dev/null 2>&1; then
+    if curl -s ${OLLAMA_URL}/api/tags > /dev/null 2>&1; then
         log "Ollama server is running!"
         # List models again to verify the server is working properly
         log "Available models on the server:"
-        curl -s http://localhost:11434/api/tags | jq . 2>&1 | tee -a $LOG_FILE || log "Failed to list models from API"
+        curl -s ${OLLAMA_URL}/api/tags | jq . 2>&1 | tee -a $LOG_FILE || log "Failed to list models from API"
         success=true
         break
     fi
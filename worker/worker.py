@@ -9,12 +9,22 @@ This script:
 5. Saves results back to a shared volume
 """
 
-import json
+import orjson
 import time
 import os
+import socket
+import hashlib
+import sqlite3
+import threading
 import subprocess
 import logging
+import httpx
 import ollama
+import ijson
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from itertools import islice
+from urllib.parse import urlsplit
 from tqdm import tqdm
 
 # Configure logging
@@ -34,13 +44,59 @@ MODEL_NAME = os.environ.get('MODEL_NAME', 'phi:mini')
 FRAGMENT_DIR = "/data/fragments"
 RESULT_DIR = "/results/fragments"
 GPU_MEMORY_LIMIT = int(os.environ.get('GPU_MEMORY_LIMIT', 2048))  # In MB
-CHECKPOINT_INTERVAL = 100  # Save checkpoint every 100 entries
+CHECKPOINT_INTERVAL = 100  # Log checkpoint progress every 100 entries
+OLLAMA_NUM_PARALLEL = int(os.environ.get('OLLAMA_NUM_PARALLEL', 4))  # Requests in flight, also passed to the Ollama server
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', 16))  # Entries handed to enhance_batch at a time
+SORT_WINDOW = int(os.environ.get('SORT_WINDOW', BATCH_SIZE * 8))  # Entries regrouped by prompt length before batching
+NUM_GPUS = int(os.environ.get('NUM_GPUS', 1))
+CUDA_VISIBLE_DEVICES = os.environ.get('CUDA_VISIBLE_DEVICES', str(WORKER_ID % NUM_GPUS))  # Spread workers over the GPUs
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', f"127.0.0.1:{11434 + WORKER_ID}")  # Own port per worker, so replicas can share a host
+READY_TIMEOUT = 30  # Seconds to wait for the Ollama port to accept connections
 
 # Input and output files
 INPUT_FILE = f"{FRAGMENT_DIR}/fragment_{WORKER_ID}.json"
 OUTPUT_FILE = f"{RESULT_DIR}/result_{WORKER_ID}.json"
-CHECKPOINT_FILE = f"{RESULT_DIR}/checkpoint_{WORKER_ID}.json"
+CHECKPOINT_FILE = f"{RESULT_DIR}/checkpoint_{WORKER_ID}.jsonl"  # Header line, then one processed entry per line
+FAILED_KEY = "_failed"  # Checkpoint lines {"_failed": entry} hold entries still to retry
+FAILED_PREFIX = b'{"_failed":'
 PROGRESS_FILE = f"{RESULT_DIR}/progress_{WORKER_ID}.json"
+CACHE_FILE = f"{RESULT_DIR}/cache_{WORKER_ID}.sqlite"  # Enhanced outputs keyed by input/output hash, kept across runs
+
+# One Ollama client for the whole worker, its connection pool is shared by every request and retry
+HTTP_TIMEOUT = httpx.Timeout(120.0, connect=2.0)  # A stuck request must not hold a pool thread forever
+CLIENT = ollama.Client(
+    host=OLLAMA_HOST,
+    timeout=HTTP_TIMEOUT,
+    headers={"Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"},
+    limits=httpx.Limits(max_connections=OLLAMA_NUM_PARALLEL, max_keepalive_connections=OLLAMA_NUM_PARALLEL),
+)
+
+def open_cache():
+    """Open the enhancement cache shared by all pool threads."""
+    conn = sqlite3.connect(CACHE_FILE, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS enhanced (key TEXT PRIMARY KEY, output TEXT NOT NULL)")
+    return conn
+
+CACHE = open_cache()
+CACHE_LOCK = threading.Lock()
+
+def cache_key(code_sample, original_output):
+    """Hash an entry's input/output pair, with the model and prompt that enhance it, into a cache key."""
+    # Outputs from another model or prompt template must not be reused
+    key = "\0".join((MODEL_NAME, PROMPT_DIGEST, str(code_sample), str(original_output)))
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+def cached_output(key):
+    """Return the cached enhanced output for key, or None."""
+    with CACHE_LOCK:
+        row = CACHE.execute("SELECT output FROM enhanced WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def store_output(key, enhanced_output):
+    """Remember an enhanced output for key."""
+    with CACHE_LOCK:
+        CACHE.execute("INSERT OR IGNORE INTO enhanced (key, output) VALUES (?, ?)", (key, enhanced_output))
 
 def save_progress(processed_count, total_count, stage="processing"):
     """Save current progress to file for monitoring."""
@@ -53,8 +109,8 @@ def save_progress(processed_count, total_count, stage="processing"):
             "stage": stage,
             "timestamp": time.time()
         }
-        with open(PROGRESS_FILE, 'w') as f:
-            json.dump(progress_data, f)
+        with open(PROGRESS_FILE, 'wb') as f:
+            f.write(orjson.dumps(progress_data))
     except Exception as e:
         logger.warning(f"Failed to save progress: {e}")
 
@@ -62,58 +118,96 @@ def load_checkpoint():
     """Load checkpoint data if it exists."""
     if os.path.exists(CHECKPOINT_FILE):
         try:
-            with open(CHECKPOINT_FILE, 'r') as f:
-                checkpoint = json.load(f)
+            with open(CHECKPOINT_FILE, 'rb') as f:
+                header = f.readline()
+                checkpoint = orjson.loads(header)
+                processed = 0
+                size = len(header)
+                failed = {}
+                for line in f:
+                    # A crash can leave a partially written last line behind
+                    if not line.endswith(b"\n"):
+                        break
+                    if line.startswith(FAILED_PREFIX):
+                        failed[processed] = orjson.loads(line)[FAILED_KEY]
+                    processed += 1
+                    size += len(line)
+            checkpoint["processed"] = processed
+            checkpoint["size"] = size
+            checkpoint["failed"] = failed
             logger.info(f"Loaded checkpoint: {checkpoint['processed']}/{checkpoint['total']} entries processed")
             return checkpoint
         except Exception as e:
             logger.warning(f"Failed to load checkpoint: {e}")
     return None
 
-def save_checkpoint(processed_entries, total_entries, data_structure, original_data, list_field_name=None):
-    """Save checkpoint with current progress."""
-    try:
-        checkpoint_data = {
-            "processed": len(processed_entries),
-            "total": total_entries,
-            "data_structure": data_structure,
-            "list_field_name": list_field_name,
-            "timestamp": time.time(),
-            "processed_entries": processed_entries
-        }
-        
-        # Save checkpoint
-        with open(CHECKPOINT_FILE, 'w') as f:
-            json.dump(checkpoint_data, f, indent=2)
-        
-        # Also save current results
-        if data_structure == "list":
-            result_data = processed_entries
-        elif data_structure == "dict_with_data":
-            result_data = original_data.copy()
-            result_data["data"] = processed_entries
-        elif data_structure == "dict_with_list":
-            result_data = original_data.copy()
-            result_data[list_field_name] = processed_entries
-        else:  # single_object
-            result_data = processed_entries[0] if processed_entries else {}
-
-        with open(f"{OUTPUT_FILE}.checkpoint", 'w') as f:
-            json.dump(result_data, f, indent=2)
-            
-        logger.info(f"Checkpoint saved: {len(processed_entries)}/{total_entries} entries")
-        
-    except Exception as e:
-        logger.error(f"Failed to save checkpoint: {e}")
-
-def enhance_description(entry):
-    """Enhance a vulnerability(or any) description using the Ollama Python library."""
-    #change the fields to be selected here
-    original_output = entry.get("output", "")
-    code_sample = entry.get("input", "")
-
-    # change this if you want a different prompt
-    prompt = f"""You are a cybersecurity expert. Improve the following vulnerability explanation by:
+def iter_checkpoint_entries():
+    """Yield the serialized entries stored in the checkpoint, without their newlines or failed markers."""
+    with open(CHECKPOINT_FILE, 'rb') as f:
+        f.readline()  # Header
+        for line in f:
+            if line.startswith(FAILED_PREFIX):
+                yield line[len(FAILED_PREFIX):-2]
+            else:
+                yield line.rstrip(b"\n")
+
+def write_atomic(path, chunks):
+    """Write chunks of bytes to path via a fsynced temp file, so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def start_checkpoint(total_entries, data_structure, list_field_name=None):
+    """Atomically create a fresh checkpoint file and return it open for appending entries."""
+    tmp_path = f"{CHECKPOINT_FILE}.tmp"
+    checkpoint_file = open(tmp_path, 'wb')
+    header = {
+        "total": total_entries,
+        "data_structure": data_structure,
+        "list_field_name": list_field_name,
+        "timestamp": time.time()
+    }
+    checkpoint_file.write(orjson.dumps(header, option=orjson.OPT_APPEND_NEWLINE))
+    checkpoint_file.flush()
+    os.fsync(checkpoint_file.fileno())
+
+    # The open handle follows the rename, later appends land in CHECKPOINT_FILE
+    os.replace(tmp_path, CHECKPOINT_FILE)
+    return checkpoint_file
+
+def resume_checkpoint(size):
+    """Reopen the checkpoint for appending, dropping anything after its last complete line."""
+    checkpoint_file = open(CHECKPOINT_FILE, 'r+b')
+    checkpoint_file.truncate(size)
+    checkpoint_file.seek(size)
+    return checkpoint_file
+
+def append_checkpoint(checkpoint_file, entries):
+    """Append newly processed entries to the checkpoint file."""
+    for entry in entries:
+        checkpoint_file.write(orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE))
+    checkpoint_file.flush()
+
+def first_char(f):
+    """Return the first non-whitespace byte of a binary file and rewind it."""
+    while True:
+        char = f.read(1)
+        if not char or not char.isspace():
+            f.seek(0)
+            return char
+
+def iter_fragment_entries():
+    """Stream the entries of a list fragment one at a time."""
+    with open(INPUT_FILE, 'rb') as f:
+        yield from ijson.items(f, "item", use_float=True)
+
+# Prompt template, split around the code sample and the original description.
+# The instructions come first so every request shares the same prefix, which Ollama keeps cached.
+PROMPT_HEADER = """You are a cybersecurity expert. Improve the following vulnerability explanation by:
 1. Fixing grammar and sentence structure
 2. Making the description more clear and descriptive
 3. Ensuring proper technical explanations while keeping the same structure
@@ -123,31 +217,78 @@ def enhance_description(entry):
 
 The vulnerability relates to this code:
 ```c/cpp
-{code_sample}
+"""
+PROMPT_MID = """
 ```
 
 Original vulnerability description:
-{original_output}
+"""
+PROMPT_TAIL = """
 
 Enhanced description:"""
+PROMPT_DIGEST = hashlib.blake2b("\0".join((PROMPT_HEADER, PROMPT_MID, PROMPT_TAIL)).encode(), digest_size=8).hexdigest()
+
+CHARS_PER_TOKEN = 3  # Conservative token estimate for code-heavy prompts
+MAX_NUM_PREDICT = 256
+PROMPT_CHARS = len(PROMPT_HEADER) + len(PROMPT_MID) + len(PROMPT_TAIL)
+
+def estimate_prompt_tokens(entry):
+    """Approximate the number of prompt tokens sent for an entry."""
+    chars = PROMPT_CHARS + len(str(entry.get("input", ""))) + len(str(entry.get("output", "")))
+    return chars // CHARS_PER_TOKEN + 1
+
+def scan_entries(entries):
+    """Count the entries and find the largest estimated prompt among them."""
+    total_entries = 0
+    max_prompt_tokens = 0
+    for entry in entries:
+        total_entries += 1
+        max_prompt_tokens = max(max_prompt_tokens, estimate_prompt_tokens(entry))
+    return total_entries, max_prompt_tokens
+
+def context_size(max_prompt_tokens):
+    """Smallest multiple of 512 that fits the largest prompt plus its output."""
+    return -(-(max_prompt_tokens + MAX_NUM_PREDICT) // 512) * 512
+
+def enhance_description(entry, num_ctx, temperature=0.2):
+    """Enhance a vulnerability(or any) description using the Ollama Python library."""
+    #change the fields to be selected here
+    original_output = entry.get("output", "")
+    code_sample = entry.get("input", "")
+
+    # Reuse the enhancement of an identical entry from this or an earlier run
+    key = cache_key(code_sample, original_output)
+    enhanced_output = cached_output(key)
+    if enhanced_output is not None:
+        updated_entry = entry.copy()
+        updated_entry["output"] = enhanced_output
+        return updated_entry
+
+    # change PROMPT_HEADER/PROMPT_MID/PROMPT_TAIL if you want a different prompt
+    prompt = f"{PROMPT_HEADER}{code_sample}{PROMPT_MID}{original_output}{PROMPT_TAIL}"
+
+    # Budget output tokens from the original description's length instead of a fixed 256
+    num_predict = min(MAX_NUM_PREDICT, max(64, int(1.3 * len(str(original_output).split()))))
 
     max_retries = 3
     for retry in range(max_retries):
         try:
-            # Use the ollama.chat function to get a response
-            response = ollama.chat(
-                model="gemma3:1b-it-qat",  # Use the pulled model name
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+            # Use the shared client to get a response
+            response = CLIENT.generate(
+                model=MODEL_NAME,  # The model pulled by start-ollama.sh
+                prompt=prompt,
                 options={
-                    "temperature": 0.2, # change temprature for more creative responses
-                    "num_predict": 256 # change number of tokens for more/less detailed explanations/responses
-                }
+                    "temperature": temperature, # change the default for more creative responses
+                    "num_predict": num_predict, # change the bounds above for more/less detailed explanations/responses
+                    "num_ctx": num_ctx, # sized to the fragment's largest prompt
+                    "stop": ["\n\n\n", "```"] # cut off runaway generations
+                },
+                keep_alive=-1  # Keep the model loaded between entries
             )
 
             # Extract the enhanced description
-            enhanced_output = response["message"]["content"].strip()
+            enhanced_output = response["response"].strip()
+            store_output(key, enhanced_output)
 
             # Create a new entry with the enhanced output
             updated_entry = entry.copy()
@@ -155,27 +296,119 @@ Enhanced description:"""
             return updated_entry
 
         except Exception as e:
-            logger.warning(f"Exception in ollama.chat: {e} (Retry {retry+1}/{max_retries})")
+            logger.warning(f"Exception in ollama.generate: {e} (Retry {retry+1}/{max_retries})")
             time.sleep(2)
 
     # If all retries fail, keep the original entry
     logger.error(f"Failed to process entry after {max_retries} attempts - keeping original")
     return entry
 
+ENTRIES_PLACEHOLDER = "__enhancer_entries__"
+
+def output_envelope(data, field):
+    """Return the bytes written before and after the serialized entries stored under field."""
+    envelope = data.copy()
+    envelope[field] = ENTRIES_PLACEHOLDER
+    prefix, suffix = orjson.dumps(envelope).split(orjson.dumps(ENTRIES_PLACEHOLDER), 1)
+    return prefix, suffix + b"\n"
+
+def wrap_entries(prefix, suffix, entries):
+    """Yield serialized entries as a JSON array between prefix and suffix."""
+    yield prefix
+    yield b"["
+    for n, entry in enumerate(entries):
+        if n:
+            yield b","
+        yield entry
+    yield b"]"
+    yield suffix
+
+def first_entry(entries):
+    """Yield the first serialized entry on its own, for single object fragments."""
+    yield next(iter(entries), b"{}")
+    yield b"\n"
+
+def make_rebuild_output(data, data_structure, list_field_name=None):
+    """Pick, once per run, how serialized entries are turned into the bytes of the result file."""
+    if data_structure == "list":
+        return partial(wrap_entries, b"", b"\n")
+    elif data_structure == "dict_with_data":
+        return partial(wrap_entries, *output_envelope(data, "data"))
+    elif data_structure == "dict_with_list":
+        return partial(wrap_entries, *output_envelope(data, list_field_name))
+    else:  # single_object
+        return first_entry
+
+def enhance_batch(pool, entries, num_ctx, temperature=0.2):
+    """Enhance a batch of entries concurrently, returning them in the original order.
+
+    Entries that could not be enhanced come back as the original object.
+    """
+    futures = {pool.submit(enhance_description, entry, num_ctx, temperature): j for j, entry in enumerate(entries)}
+
+    # Collect results as they finish, keeping the original order
+    results = [None] * len(entries)
+    for future in as_completed(futures):
+        j = futures[future]
+        try:
+            results[j] = future.result()
+        except Exception as e:
+            logger.error(f"Error processing entry: {e}")
+            # Save original entry on error
+            results[j] = entries[j]
+    return results
+
+def enhance_window(pool, window, num_ctx):
+    """Enhance a window of entries in batches of similar prompt length, returning them in the original order."""
+    # Similar lengths in a batch keep short entries from waiting on one long straggler
+    order = sorted(range(len(window)), key=lambda j: estimate_prompt_tokens(window[j]))
+
+    results = [None] * len(window)
+    for batch_indices in batched(order, BATCH_SIZE):
+        batch_results = enhance_batch(pool, [window[j] for j in batch_indices], num_ctx)
+        for j, result in zip(batch_indices, batch_results):
+            results[j] = result
+    return results
+
+def retry_failed(failed_entries, num_ctx):
+    """Retry failed entries once, more gently, returning {index: serialized entry} for the ones that succeed."""
+    indices = list(failed_entries)
+    with ThreadPoolExecutor(max_workers=max(1, OLLAMA_NUM_PARALLEL // 2)) as pool:
+        results = enhance_batch(pool, [failed_entries[i] for i in indices], num_ctx, temperature=0.1)
+    return {
+        i: orjson.dumps(result)
+        for i, result in zip(indices, results)
+        if result is not failed_entries[i]
+    }
+
+def patch_entries(entries, replacements):
+    """Yield serialized entries, swapping in replacements by index."""
+    for i, entry in enumerate(entries):
+        yield replacements.get(i, entry)
+
+def batched(items, size):
+    """Yield successive lists of at most size items from any iterable."""
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
 def process_fragment():
     """Process the assigned fragment of the dataset with checkpointing."""
     logger.info(f"Worker {WORKER_ID} starting to process fragment {INPUT_FILE}")
     save_progress(0, 0, "loading")
 
     try:
-        # Load fragment data
-        with open(INPUT_FILE, 'r') as f:
-            data = json.load(f)
+        # Sniff the fragment, list fragments (what the master writes) are streamed instead of loaded whole
+        with open(INPUT_FILE, 'rb') as f:
+            streamed = first_char(f) == b"["
+            if not streamed:
+                data = orjson.loads(f.read())
 
         # Determine data structure
         list_field_name = None
-        if isinstance(data, list):
-            entries = data
+        if streamed:
+            data = None
+            entries = iter_fragment_entries()
             data_structure = "list"
         elif isinstance(data, dict) and "data" in data:
             entries = data["data"]
@@ -191,72 +424,80 @@ def process_fragment():
                 entries = [data]  # Treat the whole JSON as a single entry
                 data_structure = "single_object"
 
-        total_entries = len(entries)
+        # Streamed fragments are scanned in a separate pass, entries is consumed by the processing loop
+        total_entries, max_prompt_tokens = scan_entries(iter_fragment_entries() if streamed else entries)
+        num_ctx = context_size(max_prompt_tokens)
+        rebuild_output = make_rebuild_output(data, data_structure, list_field_name)
         logger.info(f"Loaded {total_entries} entries, detected structure: {data_structure}")
+        logger.info(f"Using num_ctx={num_ctx} for prompts of up to ~{max_prompt_tokens} tokens")
         save_progress(0, total_entries, "loaded")
 
         # Check for existing checkpoint
         checkpoint = load_checkpoint()
         start_index = 0
-        result_entries = []
+        failed_entries = {}  # Index in the fragment -> original entry, retried after the main pass
         
         if checkpoint and checkpoint["total"] == total_entries:
             start_index = checkpoint["processed"]
-            result_entries = checkpoint["processed_entries"]
+            failed_entries = checkpoint["failed"]
+            checkpoint_file = resume_checkpoint(checkpoint["size"])
             logger.info(f"Resuming from checkpoint at entry {start_index}")
             save_progress(start_index, total_entries, "resumed")
         else:
+            checkpoint_file = start_checkpoint(total_entries, data_structure, list_field_name)
             logger.info("Starting fresh processing")
             save_progress(0, total_entries, "processing")
 
-        # Process entries from start_index
-        for i in range(start_index, total_entries):
-            try:
-                # Process single entry
-                processed_entry = enhance_description(entries[i])
-                result_entries.append(processed_entry)
+        # Process entries from start_index a window at a time, at most OLLAMA_NUM_PARALLEL requests in flight
+        # Checkpoint appends run on their own thread so disk I/O overlaps the next batch
+        processed_count = start_index
+        pending_write = None
+        with checkpoint_file, \
+                ThreadPoolExecutor(max_workers=1) as checkpoint_writer, \
+                ThreadPoolExecutor(max_workers=OLLAMA_NUM_PARALLEL) as pool:
+            for window in batched(islice(entries, start_index, None), SORT_WINDOW):
+                batch_results = enhance_window(pool, window, num_ctx)
+                for j, (entry, result) in enumerate(zip(window, batch_results)):
+                    if result is entry:
+                        failed_entries[processed_count + j] = entry
+                        # Marked in the checkpoint so a resumed run retries it as well
+                        batch_results[j] = {FAILED_KEY: entry}
                 
-                # Brief pause to avoid overwhelming Ollama
-                time.sleep(0.1)
+                # Keep at most one write outstanding, this also surfaces write errors
+                if pending_write:
+                    pending_write.result()
+                pending_write = checkpoint_writer.submit(append_checkpoint, checkpoint_file, batch_results)
                 
-                processed_count = len(result_entries)
+                previous_count = processed_count
+                processed_count += len(batch_results)
                 
-                # Save checkpoint every CHECKPOINT_INTERVAL entries
-                if processed_count % CHECKPOINT_INTERVAL == 0:
-                    save_checkpoint(result_entries, total_entries, data_structure, data, list_field_name)
+                # Report checkpoint progress every CHECKPOINT_INTERVAL entries
+                if processed_count // CHECKPOINT_INTERVAL > previous_count // CHECKPOINT_INTERVAL:
                     save_progress(processed_count, total_entries, "processing")
                     logger.info(f"Processed {processed_count}/{total_entries} entries ({processed_count/total_entries*100:.1f}%)")
                 
                 # Update progress more frequently for monitoring
-                if processed_count % 10 == 0:
+                if processed_count // 10 > previous_count // 10:
                     save_progress(processed_count, total_entries, "processing")
-                    
-            except Exception as e:
-                logger.error(f"Error processing entry {i}: {e}")
-                # Save original entry on error
-                result_entries.append(entries[i])
-
-        # Save final results
-        if data_structure == "list":
-            final_data = result_entries
-        elif data_structure == "dict_with_data":
-            final_data = data.copy()
-            final_data["data"] = result_entries
-        elif data_structure == "dict_with_list":
-            final_data = data.copy()
-            final_data[list_field_name] = result_entries
-        else:  # single_object
-            final_data = result_entries[0] if result_entries else {}
-
-        with open(OUTPUT_FILE, 'w') as f:
-            json.dump(final_data, f, indent=2)
-
-        # Clean up checkpoint files after successful completion
+
+            if pending_write:
+                pending_write.result()
+
+        # Give the entries that failed one more pass with less concurrency and a lower temperature
+        retried = {}
+        if failed_entries:
+            logger.info(f"Retrying {len(failed_entries)} failed entries")
+            save_progress(processed_count, total_entries, "retrying")
+            retried = retry_failed(failed_entries, num_ctx)
+            logger.info(f"Recovered {len(retried)}/{len(failed_entries)} failed entries")
+
+        # Save final results inside the pre-serialized wrapper, streamed from the checkpoint
+        write_atomic(OUTPUT_FILE, rebuild_output(patch_entries(iter_checkpoint_entries(), retried)))
+
+        # Clean up the checkpoint file after successful completion
         try:
             if os.path.exists(CHECKPOINT_FILE):
                 os.remove(CHECKPOINT_FILE)
-            if os.path.exists(f"{OUTPUT_FILE}.checkpoint"):
-                os.remove(f"{OUTPUT_FILE}.checkpoint")
         except:
             pass
 
@@ -268,6 +509,31 @@ def process_fragment():
         save_progress(0, 0, "error")
         raise
 
+def ollama_address():
+    """Return the (host, port) OLLAMA_HOST points at."""
+    url = urlsplit(OLLAMA_HOST if "://" in OLLAMA_HOST else f"http://{OLLAMA_HOST}")
+    return url.hostname or "127.0.0.1", url.port or 11434
+
+def wait_for_ollama(timeout=READY_TIMEOUT):
+    """Poll the Ollama port until it accepts a TCP connection or timeout seconds pass."""
+    address = ollama_address()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection(address, timeout=2):
+                return True
+        except OSError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.2)
+
+def model_available(models):
+    """Check whether MODEL_NAME is among the models listed by the Ollama server."""
+    # Untagged names are stored with the implicit :latest tag
+    wanted = MODEL_NAME if ":" in MODEL_NAME else f"{MODEL_NAME}:latest"
+    names = {m.get("model") or m.get("name") for m in models["models"]}
+    return wanted in names
+
 def start_ollama_with_bash():
     """Start Ollama using the bash script."""
     logger.info("Starting Ollama using the bash script")
@@ -281,23 +547,35 @@ def start_ollama_with_bash():
                 **os.environ,
                 "WORKER_ID": str(WORKER_ID),
                 "MODEL_NAME": MODEL_NAME,
-                "GPU_MEMORY_LIMIT": str(GPU_MEMORY_LIMIT)
+                "GPU_MEMORY_LIMIT": str(GPU_MEMORY_LIMIT),
+                "OLLAMA_HOST": OLLAMA_HOST,
+                "CUDA_VISIBLE_DEVICES": CUDA_VISIBLE_DEVICES
             },
             check=True
         )
 
         if result.returncode == 0:
             logger.info("Ollama started successfully via bash script")
-            save_progress(0, 0, "ollama_ready")
-            # Verify we can connect using the Python library
+            # Verify we can connect, a TCP connect is enough to know the server is listening
             try:
-                models = ollama.list()
-                logger.info(f"Successfully connected to Ollama using Python library")
-                return True
+                if not wait_for_ollama():
+                    raise ConnectionError(f"no connection to {OLLAMA_HOST} after {READY_TIMEOUT}s")
+                # One sanity check through the Python library
+                models = CLIENT.list()
+                logger.info("Successfully connected to Ollama using Python library")
             except Exception as e:
                 logger.warning(f"Bash script succeeded but Python library connection failed: {e}")
                 save_progress(0, 0, "ollama_connection_failed")
                 return False
+
+            # Fail fast rather than erroring on every entry when the model isn't there
+            if not model_available(models):
+                logger.error(f"Model {MODEL_NAME} is not available on the Ollama server")
+                save_progress(0, 0, "model_missing")
+                return False
+            logger.info(f"Using model {MODEL_NAME}")
+            save_progress(0, 0, "ollama_ready")
+            return True
         else:
             logger.error(f"Bash script failed with return code {result.returncode}")
             save_progress(0, 0, "ollama_start_failed")